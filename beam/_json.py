@@ -0,0 +1,18 @@
+import importlib
+import json
+from typing import Any
+
+
+def _import_optional(name: str) -> Any:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+# orjson is much faster, fallback to the standard library json module if it isn't installed
+_orjson = _import_optional('orjson')
+
+
+def dumps(obj: Any) -> str:
+    return _orjson.dumps(obj).decode('utf-8') if _orjson else json.dumps(obj)
@@ -0,0 +1,5 @@
+import yaml
+
+# the libyaml (C) loader and dumper are much faster, fallback to the pure python ones if PyYAML was built without libyaml
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
@@ -3,17 +3,15 @@ import subprocess
 from dataclasses import dataclass, field
 from typing import Optional
 
-from dataclasses_json import DataClassJsonMixin
-
 from beam.aws.models import Boto3SessionConfig, AwsRdsInstance, AwsEksInstance
 from beam.eks import update_kubeconfig
 from beam.hosts import edit_hosts_entry
 from beam.ssm import start_ssm_forwarding_session
-from beam.utils import hash_val, logger
+from beam.utils import logger
 
 
 @dataclass
-class AwsBastion(DataClassJsonMixin):
+class AwsBastion:
     # session details
     boto3_session_config: Boto3SessionConfig
 
@@ -24,6 +22,25 @@ class AwsBastion(DataClassJsonMixin):
     rds_instances: list[AwsRdsInstance] = field(default_factory=list, init=True)
     eks_instances: list[AwsEksInstance] = field(default_factory=list, init=True)
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AwsBastion':
+        return cls(boto3_session_config=Boto3SessionConfig.from_dict(data['boto3_session_config']),
+                   instance_id=data['instance_id'],
+                   name=data['name'],
+                   vpc_id=data['vpc_id'],
+                   rds_instances=[AwsRdsInstance.from_dict(rds_instance) for rds_instance in data.get('rds_instances') or []],
+                   eks_instances=[AwsEksInstance.from_dict(eks_instance) for eks_instance in data.get('eks_instances') or []])
+
+    def to_dict(self) -> dict:
+        return {
+            'boto3_session_config': self.boto3_session_config.to_dict(),
+            'instance_id': self.instance_id,
+            'name': self.name,
+            'vpc_id': self.vpc_id,
+            'rds_instances': [rds_instance.to_dict() for rds_instance in self.rds_instances],
+            'eks_instances': [eks_instance.to_dict() for eks_instance in self.eks_instances],
+        }
+
     def get_eks_clusters(self) -> list[AwsEksInstance]:
         from beam.aws.utils import get_all_eks_clusters  # local import is required to avoid circular imports
         eks_clusters = get_all_eks_clusters(self.boto3_session_config.get_session())
@@ -31,7 +48,8 @@ class AwsBastion(DataClassJsonMixin):
 
         return eks_clusters
 
-    def connect_to_eks(self, eks_instance: AwsEksInstance, default_namespace: str = 'default') -> Optional[subprocess.Popen]:
+    def connect_to_eks(self, eks_instance: AwsEksInstance, default_namespace: str = 'default',
+                       set_current_context: bool = True) -> Optional[subprocess.Popen]:
         from beam.aws.utils import get_profile_name  # local import is required to avoid circular imports
 
         session = self.boto3_session_config.get_session()
@@ -45,12 +63,11 @@ class AwsBastion(DataClassJsonMixin):
         edit_hosts_entry(cluster_endpoint_api)
         profile_name = get_profile_name(account_id, role)
 
-        local_port = hash_val(eks_instance.endpoint) + (1024 * 16)
-
-        update_kubeconfig(session, eks_instance.name, region, profile_name, local_port, default_namespace=default_namespace)
+        update_kubeconfig(session, eks_instance.name, region, profile_name, eks_instance.local_port, default_namespace=default_namespace,
+                          set_current_context=set_current_context)
         process = start_ssm_forwarding_session(region, bastion.instance_id,
                                                cluster_endpoint_api, 443,
-                                               local_port, profile_name)
+                                               eks_instance.local_port, profile_name)
 
         return process
 
@@ -1,39 +1,120 @@
+from __future__ import annotations
+
+import threading
+import weakref
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING, Any, Optional
+
+from beam.utils import hash_val, lazy_import
+
+# boto3 (and botocore with it) is heavy to import, only load it once an AWS call is made
+if TYPE_CHECKING:
+    import boto3
+    from botocore.config import Config
+else:
+    boto3 = lazy_import('boto3')
+aws_sso_lib = lazy_import('aws_sso_lib')
+botocore_config = lazy_import('botocore.config')
+
+# building clients from the same session is not thread-safe (clients themselves are), each session gets its own
+# lock, so the clients of different sessions (each with its own loader) are still built concurrently
+_session_locks: weakref.WeakKeyDictionary[boto3.Session, threading.Lock] = weakref.WeakKeyDictionary()
+_session_locks_lock = threading.Lock()
+
+
+def _get_session_lock(session: boto3.Session) -> threading.Lock:
+    with _session_locks_lock:
+        if (lock := _session_locks.get(session)) is None:
+            lock = _session_locks[session] = threading.Lock()
+        return lock
+
+
+@cache
+def get_boto_config() -> Config:
+    """Get the botocore config shared by all clients."""
+    # adaptive retries back off (with jitter) when throttled, the larger connection pool
+    # lets the concurrent scans share a client without queueing on urllib3
+    return botocore_config.Config(retries={'mode': 'adaptive', 'max_attempts': 6}, max_pool_connections=50)
+
+
+@lru_cache(maxsize=None)
+def build_session(sso_start_url: str, account_id: str, role_name: str, sso_region: str, region: str) -> boto3.Session:
+    """Get a (cached) boto3 session for the given SSO account, role and region."""
+    return aws_sso_lib.get_boto3_session(sso_start_url, account_id=account_id,
+                                         role_name=role_name,
+                                         sso_region=sso_region, region=region)
+
 
-import aws_sso_lib
-import boto3
-from dataclasses_json import DataClassJsonMixin, config
+@cache
+def get_client(session: boto3.Session, service: str, region: Optional[str] = None) -> Any:
+    """Get a (cached) boto3 client for the given session, service and region."""
+    with _get_session_lock(session):
+        return session.client(service, region_name=region, config=get_boto_config())
 
-from beam.utils import hash_val
+
+@cache
+def get_resource(session: boto3.Session, service: str, region: Optional[str] = None) -> Any:
+    """Get a (cached) boto3 resource for the given session, service and region."""
+    with _get_session_lock(session):
+        return session.resource(service, region_name=region, config=get_boto_config())
 
 
 @dataclass
-class Boto3SessionConfig(DataClassJsonMixin):
+class Boto3SessionConfig:
     account_id: str
     sso_start_url: str
     sso_region: str
     role_name: str
     region: str
-    _session: Optional[boto3.Session] = field(init=False, default=None, metadata=config(exclude=lambda x: True,
-                                                                                        encoder=lambda x: None,
-                                                                                        decoder=lambda x: None))
+    _session: Optional[boto3.Session] = field(init=False, default=None)
     vpc_id: Optional[str] = None
 
+    @classmethod
+    def from_dict(cls, data: dict) -> Boto3SessionConfig:
+        return cls(data['account_id'], data['sso_start_url'], data['sso_region'], data['role_name'], data['region'],
+                   vpc_id=data.get('vpc_id'))
+
+    def to_dict(self) -> dict:
+        # the session itself is not serialized
+        return {
+            'account_id': self.account_id,
+            'sso_start_url': self.sso_start_url,
+            'sso_region': self.sso_region,
+            'role_name': self.role_name,
+            'region': self.region,
+            'vpc_id': self.vpc_id,
+        }
+
     def get_session(self) -> boto3.Session:
         if self._session is None:
-            self._session = aws_sso_lib.get_boto3_session(self.sso_start_url, account_id=self.account_id,
-                                                          role_name=self.role_name,
-                                                          sso_region=self.sso_region, region=self.region)
+            self._session = build_session(self.sso_start_url, self.account_id, self.role_name, self.sso_region, self.region)
         return self._session
 
 
+# endpoints are mapped to local ports in [LOCAL_PORT_OFFSET, LOCAL_PORT_OFFSET + LOCAL_PORT_RANGE), i.e. [16384, 32767]
+LOCAL_PORT_OFFSET = 1024 * 16
+LOCAL_PORT_RANGE = 1024 * 16
+
+
 @dataclass
 class AwsEksInstance:
     name: str
     endpoint: str
     arn: str
     vpc_id: Optional[str] = None
+    local_port: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.local_port = hash_val(self.endpoint, LOCAL_PORT_RANGE) + LOCAL_PORT_OFFSET
+
+    @classmethod
+    def from_dict(cls, data: dict) -> AwsEksInstance:
+        return cls(data['name'], data['endpoint'], data['arn'], vpc_id=data.get('vpc_id'))
+
+    def to_dict(self) -> dict:
+        # local_port is computed from the endpoint, it is not serialized
+        return {'name': self.name, 'endpoint': self.endpoint, 'arn': self.arn, 'vpc_id': self.vpc_id}
 
 
 @dataclass
@@ -48,7 +129,15 @@ class AwsRdsInstance:
     endpoint: str
     port: int
     vpc_id: Optional[str] = None
+    local_port: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.local_port = hash_val(self.endpoint, LOCAL_PORT_RANGE) + LOCAL_PORT_OFFSET
+
+    @classmethod
+    def from_dict(cls, data: dict) -> AwsRdsInstance:
+        return cls(data['identifier'], data['endpoint'], data['port'], vpc_id=data.get('vpc_id'))
 
-    @property
-    def local_port(self) -> int:
-        return hash_val(self.endpoint) + 1024 * 16
+    def to_dict(self) -> dict:
+        # local_port is computed from the endpoint, it is not serialized
+        return {'identifier': self.identifier, 'endpoint': self.endpoint, 'port': self.port, 'vpc_id': self.vpc_id}
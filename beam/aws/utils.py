@@ -1,15 +1,50 @@
 import concurrent
 import fnmatch
+import re
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional
-
-import aws_sso_lib
-import boto3
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Mapping, Optional, TypeVar
 
 from beam.aws.bastion import AwsBastion
-from beam.aws.models import AwsEksInstance, Boto3SessionConfig, AwsAccount, AwsRdsInstance
+from beam.aws.models import AwsEksInstance, Boto3SessionConfig, AwsAccount, AwsRdsInstance, aws_sso_lib, build_session, get_client, get_resource
 from beam.config_loader import BeamConfig
-from beam.utils import add_profile_to_aws_config, logger
+from beam.utils import AwsConfigWriter, logger
+
+if TYPE_CHECKING:
+    import boto3
+
+# fixed concurrency caps, keeps beam parallel without getting throttled by AWS
+MAX_REGION_WORKERS = 32
+MAX_RESOURCE_WORKERS = 32
+MAX_CALL_WORKERS = 16
+# max number of identifiers sent in a single RDS describe filter
+RDS_FILTER_MAX_VALUES = 100
+
+# all the concurrent work goes through these shared pools, so the thread count stays bounded however many
+# accounts, regions and resources there are. region tasks wait on resource tasks, which wait on call tasks,
+# and call tasks never wait on other tasks, so a task never waits on the pool it is running on
+_region_executor = ThreadPoolExecutor(max_workers=MAX_REGION_WORKERS, thread_name_prefix='beam-region')
+_resource_executor = ThreadPoolExecutor(max_workers=MAX_RESOURCE_WORKERS, thread_name_prefix='beam-resource')
+_call_executor = ThreadPoolExecutor(max_workers=MAX_CALL_WORKERS, thread_name_prefix='beam-call')
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def run_concurrently(func: Callable[[T], R], items: Iterable[T]) -> list[R]:
+    """
+    Runs func on each of the items on the shared (bounded) call pool.
+    func must not wait on tasks of that pool itself, otherwise it can deadlock.
+    :param func: function to run
+    :param items: items to run the function on
+    :return: the results, in the order of the items
+    """
+    return list(_call_executor.map(func, items))
+
+
+# (account_id, role) profiles already written to the AWS config by this process
+_REGISTERED_PROFILES: set[tuple[str, str]] = set()
+_registered_profiles_lock = threading.Lock()
 
 
 class AwsOrganization:
@@ -17,143 +52,211 @@ class AwsOrganization:
         self.sso_start_url = sso_start_url
         self.sso_region = sso_region
         self.accounts: list[tuple[str, str]] = []
+        self._aws_accounts: Optional[list[AwsAccount]] = None
+        self._roles: dict[str, list[tuple[str, str, str]]] = {}
+        self._regions: dict[str, list[str]] = {}
+
+    def login(self) -> None:
+        """
+        Logs in to AWS SSO, aws_sso_lib does nothing if the cached SSO token is still valid.
+        """
+        aws_sso_lib.login(self.sso_start_url, self.sso_region)
 
     def get_accounts(self) -> list[AwsAccount]:
-        self.accounts = list(aws_sso_lib.list_available_accounts(self.sso_start_url, self.sso_region))
-        logger.debug(f'Found {len(self.accounts)} accounts: {self.accounts}')
-        return [AwsAccount(account[0], account[1]) for account in self.accounts]
+        if self._aws_accounts is None:
+            self.accounts = list(aws_sso_lib.list_available_accounts(self.sso_start_url, self.sso_region))
+            logger.debug(f'Found {len(self.accounts)} accounts: {self.accounts}')
+            self._aws_accounts = [AwsAccount(account[0], account[1]) for account in self.accounts]
+        return self._aws_accounts
 
     def get_all_roles(self, account: AwsAccount) -> list[tuple[str, str, str]]:
         account_id = account.id
-        roles = list(aws_sso_lib.list_available_roles(self.sso_start_url, self.sso_region, account_id))
-        logger.debug(f'Found {len(roles)} roles in account {account_id}: {roles}')
+        if (roles := self._roles.get(account_id)) is None:
+            roles = list(aws_sso_lib.list_available_roles(self.sso_start_url, self.sso_region, account_id))
+            logger.debug(f'Found {len(roles)} roles in account {account_id}: {roles}')
+            self._roles[account_id] = roles
         return roles
 
-    def get_session(self, account_id: str, permission_set_name: str, region: str) -> boto3.Session:
-        return aws_sso_lib.get_boto3_session(self.sso_start_url, account_id=account_id,
-                                             role_name=permission_set_name,
-                                             sso_region=self.sso_region, region=region)
+    def get_session(self, account_id: str, permission_set_name: str, region: str) -> 'boto3.Session':
+        return build_session(self.sso_start_url, account_id, permission_set_name, self.sso_region, region)
 
     def process_account(self, account: AwsAccount, role: str, beam_config: BeamConfig) -> list[AwsBastion]:
-        logger.info(f'Processing account {account.id}')
-        account_id = account.id
-        session = aws_sso_lib.get_boto3_session(self.sso_start_url, account_id=account_id,
-                                                role_name=role,
-                                                sso_region=self.sso_region, region=self.sso_region)
-        add_profile_to_aws_config(account_id, role, self.sso_start_url, session.region_name, session.region_name, False)
+        return self.process_accounts([account], role, beam_config)
+
+    def process_accounts(self, accounts: Iterable[AwsAccount], role: str, beam_config: BeamConfig) -> list[AwsBastion]:
+        """
+        Scans all the regions of all the given accounts concurrently.
+        :param accounts: accounts to scan
+        :param role: permission set to use in all accounts
+        :param beam_config: beam config
+        :return: list of bastions found in all accounts and regions
+        """
+        accounts = list(accounts)
+        self.register_profiles([account.id for account in accounts], role)
+
+        futures = []
+        for account in accounts:
+            logger.info(f'Processing account {account.id}')
+            for region in beam_config.aws.regions:
+                session_config = Boto3SessionConfig(account.id, self.sso_start_url, self.sso_region, role, region)
+                futures.append(_region_executor.submit(process_region, session_config, region, beam_config))
 
         bastions = []
-
-        for region in beam_config.aws.regions:
-            session_config = Boto3SessionConfig(account_id, self.sso_start_url, self.sso_region, role, region)
-
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = [executor.submit(process_region, session_config, region, beam_config)]
-                for future in concurrent.futures.as_completed(futures):
-                    if future.result():
-                        bastions.extend(future.result())
+        for future in concurrent.futures.as_completed(futures):
+            bastions.extend(future.result() or [])
 
         return bastions
 
+    def register_profiles(self, account_ids: Iterable[str], role: str) -> None:
+        """
+        Adds the AWS config profiles of the given accounts that weren't registered yet, with a single config write.
+        :param account_ids: ids of the accounts
+        :param role: permission set of the profiles
+        """
+        with _registered_profiles_lock:
+            pending = [account_id for account_id in dict.fromkeys(account_ids)
+                       if (account_id, role) not in _REGISTERED_PROFILES]
+            if not pending:
+                return
+
+            with AwsConfigWriter() as writer:
+                for account_id in pending:
+                    writer.add_profile(account_id, role, self.sso_start_url, self.sso_region, self.sso_region, False)
+            _REGISTERED_PROFILES.update((account_id, role) for account_id in pending)
+
     def get_all_regions(self, permission_set_name: str) -> list[str]:
-        regions: set[str] = set()
-        for account in self.get_accounts():
-            session = aws_sso_lib.get_boto3_session(self.sso_start_url, self.sso_region, account.id, permission_set_name, region=self.sso_region)
-            ec2_client = session.client('ec2')
-            logger.debug(f'Retrieving AWS regions for account {account.id}')
+        if (cached_regions := self._regions.get(permission_set_name)) is not None:
+            return cached_regions
 
-            try:
-                response = ec2_client.describe_regions()
-                regions.update({region['RegionName'] for region in response['Regions']})
-            except Exception as e:
-                logger.exception(f'An error occurred while retrieving AWS regions: {e}')
+        accounts = self.get_accounts()
+        if not accounts:
+            return []
 
-        return list(regions)
+        results = run_concurrently(lambda account: self._get_account_regions(account, permission_set_name), accounts)
+        regions: set[str] = set().union(*results)
 
+        self._regions[permission_set_name] = list(regions)
+        return self._regions[permission_set_name]
 
-def get_all_eks_clusters(session: boto3.Session, tags: Optional[dict[str, str]] = None) -> List[AwsEksInstance]:
+    def _get_account_regions(self, account: AwsAccount, permission_set_name: str) -> set[str]:
+        session = build_session(self.sso_start_url, account.id, permission_set_name, self.sso_region, self.sso_region)
+        ec2_client = get_client(session, 'ec2')
+        logger.debug(f'Retrieving AWS regions for account {account.id}')
+
+        try:
+            response = ec2_client.describe_regions()
+            return {region['RegionName'] for region in response['Regions']}
+        except Exception as e:
+            logger.exception(f'An error occurred while retrieving AWS regions: {e}')
+
+        return set()
+
+
+def get_all_eks_clusters(session: 'boto3.Session', tags: Optional[dict[str, str]] = None) -> List[AwsEksInstance]:
     """
     Retrieves a list of all EKS clusters in the account.
     :param session: boto3 session
-    :param tags: tags to match, 'Name' can be used with wildcards
+    :param tags: tags to match, 'Name' matches the cluster name and can be used with wildcards
     :return: list of eks clusters
     """
-    tags = tags or {}
-    client = session.client('eks')
-    paginator = client.get_paginator('list_clusters')
-    response_iterator = paginator.paginate()
-    cluster_names = []
-    for response in response_iterator:
-        cluster_names.extend(response['clusters'])
+    name_pattern, other_tags = _split_name_tag(tags or {})
+    client = get_client(session, 'eks')
+    cluster_names = _paginate(client, 'list_clusters', 'clusters')
 
-    eks_list = []
+    # filter by name before describing, so only the matching clusters cost a round-trip
+    if name_pattern:
+        cluster_names = (cluster_name for cluster_name in cluster_names if name_pattern.match(cluster_name))
 
-    for cluster_name in cluster_names:
-        try:
-            response = client.describe_cluster(name=cluster_name)
-            cluster = response['cluster']
+    # let AWS filter by the other tags when possible
+    if other_tags:
+        tagged_arns = _get_tagged_resource_arns(session, ['eks:cluster'], other_tags)
+        if tagged_arns is not None:
+            tagged_names = {arn.split('/', 1)[-1] for arn in tagged_arns}
+            cluster_names = (cluster_name for cluster_name in cluster_names if cluster_name in tagged_names)
 
-            if not match_tags(cluster['tags'], tags):
-                continue
+    # each describe is an independent round-trip, run them concurrently
+    clusters = run_concurrently(lambda name: _safe_describe_cluster(client, name), cluster_names)
 
-            eks_list.append(AwsEksInstance(cluster['name'], cluster['endpoint'], cluster['arn'], cluster['resourcesVpcConfig']['vpcId']))
-        except (client.exceptions.ResourceNotFoundException, client.exceptions.InvalidParameterException):
-            logger.exception(f'Error describing cluster {cluster_name}')
-        except Exception as e:
-            logger.exception(
-                f'Error describing cluster {cluster_name}')  # decide whether to continue or stop execution based on the type of exception
-            raise e
+    return [AwsEksInstance(cluster['name'], cluster['endpoint'], cluster['arn'], cluster['resourcesVpcConfig']['vpcId'])
+            for cluster in clusters if cluster and other_tags.items() <= cluster['tags'].items()]
+
+
+def _safe_describe_cluster(client: Any, cluster_name: str) -> Optional[dict]:
+    try:
+        return client.describe_cluster(name=cluster_name)['cluster']
+    except (client.exceptions.ResourceNotFoundException, client.exceptions.InvalidParameterException):
+        logger.exception(f'Error describing cluster {cluster_name}')
+    except Exception as e:
+        logger.exception(
+            f'Error describing cluster {cluster_name}')  # decide whether to continue or stop execution based on the type of exception
+        raise e
 
-    return eks_list
+    return None
 
 
-def get_all_rds_resources(session: boto3.Session, tags: Optional[dict[str, str]] = None) -> list[AwsRdsInstance]:
+def get_all_rds_resources(session: 'boto3.Session', tags: Optional[dict[str, str]] = None) -> list[AwsRdsInstance]:
     """
     Retrieves all RDS resources (instances and clusters)
     :param session: boto3 session
     :param tags: tags to match, 'Name' can be used with wildcards
     """
-    tags = tags or {}
-    client = session.client('rds')
+    name_pattern, other_tags = _split_name_tag(tags or {})
+    client = get_client(session, 'rds')
+
+    # let AWS filter by the other tags when possible, so only the matching resources are described
+    tagged_arns = _get_tagged_resource_arns(session, ['rds:db', 'rds:cluster'], other_tags) if other_tags else None
+
+    # Retrieve instances and clusters concurrently
+    if tagged_arns is None:
+        instances = _paginate(client, 'describe_db_instances', 'DBInstances')
+        clusters = _paginate(client, 'describe_db_clusters', 'DBClusters')
+    else:
+        instances = _describe_rds_by_arns(client, 'describe_db_instances', 'DBInstances', 'db-instance-id',
+                                          [arn for arn in tagged_arns if ':db:' in arn])
+        clusters = _describe_rds_by_arns(client, 'describe_db_clusters', 'DBClusters', 'db-cluster-id',
+                                         [arn for arn in tagged_arns if ':cluster:' in arn])
+
+    instances_future = _call_executor.submit(_filter_rds_instances, instances, name_pattern, other_tags)
+    clusters_future = _call_executor.submit(_filter_rds_clusters, clusters, name_pattern, other_tags)
+    instance_resources = instances_future.result()
+    cluster_resources = clusters_future.result()
 
-    # Retrieve instances using paginator
-    paginator = client.get_paginator('describe_db_instances')
-    response_iterator = paginator.paginate()
-    instances = [instance for response in response_iterator for instance in response['DBInstances']]
-
-    # Retrieve clusters using paginator
-    paginator = client.get_paginator('describe_db_clusters')
-    response_iterator = paginator.paginate()
-    clusters = [cluster for response in response_iterator for cluster in response['DBClusters']]
+    # Return the combined list of resources
+    return instance_resources + cluster_resources
 
-    # Filter resources based on status
-    available_instances = [i for i in instances if i['DBInstanceStatus'] == 'available']
-    available_clusters = [c for c in clusters if c['Status'] == 'available']
 
-    # Create a list of dictionaries for instances and clusters
+def _filter_rds_instances(instances: Iterable[dict], name_pattern: Optional[re.Pattern[str]], other_tags: dict[str, str]) -> list[AwsRdsInstance]:
     instance_resources: list[AwsRdsInstance] = []
 
-    name_regex = tags.pop('Name', None)
-
-    for instance in available_instances:
+    for instance in instances:
+        # Filter resources based on status
+        if instance['DBInstanceStatus'] != 'available':
+            continue
         # apply user filtering
-        if name_regex:
-            if not fnmatch.fnmatch(instance['DBInstanceIdentifier'], name_regex):
-                continue
-        if not match_key_value_tags(instance['TagList'], tags):
+        if name_pattern and not name_pattern.match(instance['DBInstanceIdentifier']):
+            continue
+        if not match_key_value_tags(instance['TagList'], other_tags):
             continue
         instance_resources.append(AwsRdsInstance(instance['DBInstanceIdentifier'],
                                                  instance['Endpoint']['Address'],
                                                  int(instance['Endpoint']['Port']), instance['DBSubnetGroup']['VpcId'])
                                   )
-    cluster_resources = []
-    for cluster in available_clusters:
+
+    return instance_resources
+
+
+def _filter_rds_clusters(clusters: Iterable[dict], name_pattern: Optional[re.Pattern[str]], other_tags: dict[str, str]) -> list[AwsRdsInstance]:
+    cluster_resources: list[AwsRdsInstance] = []
+
+    for cluster in clusters:
+        # Filter resources based on status
+        if cluster['Status'] != 'available':
+            continue
         # apply user filtering
-        if name_regex:
-            if not fnmatch.fnmatch(cluster['DBClusterIdentifier'], name_regex):
-                continue
+        if name_pattern and not name_pattern.match(cluster['DBClusterIdentifier']):
+            continue
 
-        if not match_tags(cluster['TagList'], tags):
+        if not match_key_value_tags(cluster['TagList'], other_tags):
             continue
 
         cluster_resources.append(AwsRdsInstance(cluster['DBClusterIdentifier'],
@@ -161,13 +264,43 @@ def get_all_rds_resources(session: boto3.Session, tags: Optional[dict[str, str]]
                                                 int(cluster['Port']))
                                  )
 
-    # Return the combined list of resources
-    return instance_resources + cluster_resources
+    return cluster_resources
+
+
+def _paginate(client: Any, operation_name: str, result_key: str, **kwargs: Any) -> Iterator[Any]:
+    paginator = client.get_paginator(operation_name)
+    return (item for response in paginator.paginate(**kwargs) for item in response[result_key])
 
 
-def get_matching_ec2_instance(session: boto3.Session, session_config: Boto3SessionConfig,
+def _describe_rds_by_arns(client: Any, operation_name: str, result_key: str, filter_name: str, arns: list[str]) -> Iterator[dict]:
+    return (item
+            for i in range(0, len(arns), RDS_FILTER_MAX_VALUES)
+            for item in _paginate(client, operation_name, result_key,
+                                  Filters=[{'Name': filter_name, 'Values': arns[i:i + RDS_FILTER_MAX_VALUES]}]))
+
+
+def _get_tagged_resource_arns(session: 'boto3.Session', resource_types: list[str], tags: dict[str, str]) -> Optional[list[str]]:
+    """
+    Retrieves the ARNs of the resources that have all the given tags, filtered by AWS (server-side).
+    :param session: boto3 session
+    :param resource_types: resource types to retrieve, e.g. 'rds:db'
+    :param tags: tags to match
+    :return: list of ARNs, or None if the tagging API can't be used (e.g. not allowed by the permission set)
+    """
+    client = get_client(session, 'resourcegroupstaggingapi')
+    try:
+        mappings = _paginate(client, 'get_resources', 'ResourceTagMappingList',
+                             ResourceTypeFilters=resource_types,
+                             TagFilters=[{'Key': key, 'Values': [value]} for key, value in tags.items()])
+        return [mapping['ResourceARN'] for mapping in mappings]
+    except client.exceptions.ClientError as e:
+        logger.debug(f'Could not filter {resource_types} by tags, falling back to client-side filtering: {e}')
+        return None
+
+
+def get_matching_ec2_instance(session: 'boto3.Session', session_config: Boto3SessionConfig,
                               name_regex: Optional[str],
-                              filter_tags: Optional[dict[str, str]] = None) -> list[AwsBastion]:
+                              filter_tags: Optional[Mapping[str, str]] = None) -> list[AwsBastion]:
     """
     Retrieves a list of EC2 instances that match the given criteria.
 
@@ -182,7 +315,7 @@ def get_matching_ec2_instance(session: boto3.Session, session_config: Boto3Sessi
 
     bastions = []
     try:
-        ec2_client = session.resource('ec2', region_name=session_config.region)
+        ec2_client = get_resource(session, 'ec2', session_config.region)
         filters = [{'Name': 'tag:' + tag_key, 'Values': [tag_value]} for tag_key, tag_value in filter_tags.items()]
         filters.append({'Name': 'instance-state-name', 'Values': ['running']})  # running instances only
         instances = list(ec2_client.instances.filter(Filters=filters))
@@ -216,41 +349,49 @@ def process_region(session_config: Boto3SessionConfig, region: str, beam_config:
     logger.info(f'Processing account {session_config.account_id} in region {region}')
     boto3_session = session_config.get_session()
 
-    ekss = get_all_eks_clusters(boto3_session, beam_config.eks.tags)
-    rdss = get_all_rds_resources(boto3_session, beam_config.rds.tags)
-    region_bastions = get_matching_ec2_instance(boto3_session, session_config, beam_config.bastion.name, beam_config.bastion.other_tags)
+    eks_future = _resource_executor.submit(get_all_eks_clusters, boto3_session, beam_config.eks.tags)
+    rds_future = _resource_executor.submit(get_all_rds_resources, boto3_session, beam_config.rds.tags)
+    bastions_future = _resource_executor.submit(get_matching_ec2_instance, boto3_session, session_config,
+                                                beam_config.bastion.name, beam_config.bastion.other_tags)
+
+    # the three lookups run concurrently, the results are collected one by one
+    ekss = eks_future.result()
+    rdss = rds_future.result()
+    region_bastions = bastions_future.result()
 
     if not region_bastions:
         return []
 
+    # index the resources by vpc, so each bastion is joined with its vpc resources directly
+    eks_by_vpc: dict[Optional[str], list[AwsEksInstance]] = {}
+    for eks in ekss:
+        eks_by_vpc.setdefault(eks.vpc_id, []).append(eks)
+
+    rds_by_vpc: dict[Optional[str], list[AwsRdsInstance]] = {}
+    for rds in rdss:
+        rds_by_vpc.setdefault(rds.vpc_id, []).append(rds)
+
     for bastion in region_bastions:
-        for eks in ekss:
-            if eks.vpc_id == bastion.vpc_id:
-                bastion.add_eks_instance(eks)
+        for eks in eks_by_vpc.get(bastion.vpc_id, ()):
+            bastion.add_eks_instance(eks)
 
-        for rds in rdss:
-            if rds.vpc_id == bastion.vpc_id:
-                bastion.add_rds_instance(rds)
+        for rds in rds_by_vpc.get(bastion.vpc_id, ()):
+            bastion.add_rds_instance(rds)
 
     return region_bastions
 
 
 def match_key_value_tags(actual_tags: list, desired_tags: dict) -> bool:
-    for expected_tag_key, expected_tag_value in desired_tags.items():
-        if not any(actual_tag['Key'] == expected_tag_key and actual_tag['Value'] == expected_tag_value for actual_tag in actual_tags):
-            return False
-
-    return True
+    actual = {tag['Key']: tag['Value'] for tag in actual_tags}
+    return desired_tags.items() <= actual.items()
 
 
-def match_tags(actual_tags: dict[str, str], desired_tags: dict[str, str]) -> bool:
-    if name_regex := desired_tags.get('Name'):
-        if not fnmatch.fnmatchcase(actual_tags.get('Name', ''), name_regex):
-            return False
-        desired_tags.pop('Name')
-
-    for expected_tag_key, expected_tag_value in desired_tags.items():
-        if not actual_tags.get(expected_tag_key) == expected_tag_value:
-            return False
-
-    return True
+def _split_name_tag(tags: dict[str, str]) -> tuple[Optional[re.Pattern[str]], dict[str, str]]:
+    """
+    Splits the 'Name' tag, which can be used with wildcards, from the rest of the tags.
+    :param tags: tags to match
+    :return: compiled 'Name' pattern (if any) and the rest of the tags
+    """
+    name_regex = tags.get('Name')
+    name_pattern = re.compile(fnmatch.translate(name_regex)) if name_regex else None
+    return name_pattern, {key: value for key, value in tags.items() if key != 'Name'}
@@ -1,55 +1,106 @@
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 
 import yaml
-from dataclasses_json import DataClassJsonMixin
 
+from beam._yaml import YamlLoader
 from beam.aws.bastion import AwsBastion
 
 
+def _present_keys(data: dict, *keys: str) -> dict[str, Any]:
+    """Get only the keys that are set in data, so the dataclass defaults apply to the missing ones."""
+    return {key: data[key] for key in keys if key in data}
+
+
+def _non_null_keys(data: dict, *keys: str) -> dict[str, Any]:
+    """Get only the keys that are set (and not empty) in data, e.g. a bare 'tags:' key gets the dataclass default."""
+    return {key: data[key] for key in keys if data.get(key) is not None}
+
+
 @dataclass
-class BeamEksConfig(DataClassJsonMixin):
+class BeamEksConfig:
     enabled: Optional[bool] = True
     tags: dict[str, str] = field(default_factory=dict)
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamEksConfig':
+        return cls(**_present_keys(data, 'enabled'), **_non_null_keys(data, 'tags'))
+
+    def to_dict(self) -> dict:
+        return {'enabled': self.enabled, 'tags': dict(self.tags)}
+
 
 @dataclass
-class BeamRdsConfig(DataClassJsonMixin):
+class BeamRdsConfig:
     enabled: Optional[bool] = True
     tags: dict[str, str] = field(default_factory=dict)
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamRdsConfig':
+        return cls(**_present_keys(data, 'enabled'), **_non_null_keys(data, 'tags'))
+
+    def to_dict(self) -> dict:
+        return {'enabled': self.enabled, 'tags': dict(self.tags)}
+
 
 @dataclass
-class BeamAwsConfig(DataClassJsonMixin):
+class BeamAwsConfig:
     sso_url: str
     sso_region: str
     role: str
     accounts: list[str] = field(default_factory=list)
     regions: list[str] = field(default_factory=list)
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamAwsConfig':
+        return cls(data['sso_url'], data['sso_region'], data['role'], **_non_null_keys(data, 'accounts', 'regions'))
 
-@dataclass
-class BeamBastionConfig(DataClassJsonMixin):
+    def to_dict(self) -> dict:
+        return {
+            'sso_url': self.sso_url,
+            'sso_region': self.sso_region,
+            'role': self.role,
+            'accounts': list(self.accounts),
+            'regions': list(self.regions),
+        }
+
+
+@dataclass(frozen=True)
+class BeamBastionConfig:
     tags: dict[str, str] = field(default_factory=lambda: {'Name': '*bastion*'})
 
-    @property
+    @cached_property
     def name(self) -> str:
         return self.tags.get('Name', '*bastion*')
 
-    @property
-    def other_tags(self) -> dict[str, str]:
-        tags_without_name = self.tags.copy()
-        tags_without_name.pop('Name')
-        return tags_without_name
+    @cached_property
+    def other_tags(self) -> Mapping[str, str]:
+        return MappingProxyType({key: value for key, value in self.tags.items() if key != 'Name'})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamBastionConfig':
+        return cls(**_non_null_keys(data, 'tags'))
+
+    def to_dict(self) -> dict:
+        return {'tags': dict(self.tags)}
 
 
 @dataclass
-class BeamKubernetesConfig(DataClassJsonMixin):
+class BeamKubernetesConfig:
     namespace: Optional[str] = 'default'
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamKubernetesConfig':
+        return cls(**_present_keys(data, 'namespace'))
+
+    def to_dict(self) -> dict:
+        return {'namespace': self.namespace}
+
 
 @dataclass
-class BeamConfig(DataClassJsonMixin):
+class BeamConfig:
     # aws
     aws: BeamAwsConfig
     bastion: BeamBastionConfig
@@ -59,6 +110,28 @@ class BeamConfig(DataClassJsonMixin):
 
     bastions: list[AwsBastion] = field(default_factory=list)
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BeamConfig':
+        beam_config = cls(aws=BeamAwsConfig.from_dict(data['aws']), bastion=BeamBastionConfig.from_dict(data['bastion']))
+        if 'kubernetes' in data:
+            beam_config.kubernetes = BeamKubernetesConfig.from_dict(data['kubernetes'])
+        if 'eks' in data:
+            beam_config.eks = BeamEksConfig.from_dict(data['eks'])
+        if 'rds' in data:
+            beam_config.rds = BeamRdsConfig.from_dict(data['rds'])
+        beam_config.bastions = [AwsBastion.from_dict(bastion) for bastion in data.get('bastions') or []]
+        return beam_config
+
+    def to_dict(self) -> dict:
+        return {
+            'aws': self.aws.to_dict(),
+            'bastion': self.bastion.to_dict(),
+            'kubernetes': self.kubernetes.to_dict(),
+            'eks': self.eks.to_dict(),
+            'rds': self.rds.to_dict(),
+            'bastions': [bastion.to_dict() for bastion in self.bastions],
+        }
+
     @staticmethod
     def _parse_config(config: dict) -> 'BeamConfig':
         return BeamConfig(
@@ -72,7 +145,7 @@ class BeamConfig(DataClassJsonMixin):
     @staticmethod
     def load_config(config_path: str) -> 'BeamConfig':
         with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
+            config = yaml.load(file, Loader=YamlLoader)
 
         try:
             return BeamConfig.from_dict(config)
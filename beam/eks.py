@@ -1,27 +1,73 @@
 import os
 import platform
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import boto3
 import yaml
 
+from beam._yaml import YamlDumper, YamlLoader
+from beam.aws.models import get_client
 
-def update_kubeconfig(boto3_session: boto3.Session,
+if TYPE_CHECKING:
+    import boto3
+
+# the kubeconfig is read, modified and rewritten as a whole, while clusters are connected concurrently
+_kubeconfig_lock = threading.Lock()
+
+
+def update_kubeconfig(boto3_session: 'boto3.Session',
                       cluster_name: str,
                       cluster_region: str,
                       cluster_profile: str,
                       local_api_server_port: int,
                       kubeconfig_path: Optional[str] = None,
-                      default_namespace: str = 'default') -> None:
+                      default_namespace: str = 'default',
+                      set_current_context: bool = True) -> None:
     if not kubeconfig_path:
         kubeconfig_path = str(Path.home() / '.kube' / 'config')
-    eks_client = boto3_session.client('eks')
+    eks_client = get_client(boto3_session, 'eks')
     eks_cluster = eks_client.describe_cluster(name=cluster_name)['cluster']
 
+    with _kubeconfig_lock:
+        _write_kubeconfig_entries(kubeconfig_path, eks_cluster, cluster_name, cluster_region, cluster_profile,
+                                  local_api_server_port, default_namespace, set_current_context)
+
+
+def get_kubeconfig_name(cluster_arn: str) -> str:
+    """The name of the cluster, context and user entries of an EKS cluster in the kubeconfig."""
+    # arn:aws:eks:<region>:<account_id>:cluster/<cluster_name>
+    _, _, _, cluster_region, account_id, resource = cluster_arn.split(':', 5)
+    return f"{account_id}:{cluster_region}:{resource.split('/', 1)[-1]}"
+
+
+def set_kubeconfig_current_context(context_name: str, kubeconfig_path: Optional[str] = None) -> None:
+    if not kubeconfig_path:
+        kubeconfig_path = str(Path.home() / '.kube' / 'config')
+
+    with _kubeconfig_lock:
+        with open(kubeconfig_path, 'r') as file:
+            kubeconfig = yaml.load(file, Loader=YamlLoader) or {}
+        if kubeconfig.get('current-context') == context_name:
+            return
+
+        kubeconfig['current-context'] = context_name
+        config_text = yaml.dump(kubeconfig, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+        with open(kubeconfig_path, 'w+') as file:
+            file.write(config_text)
+
+
+def _write_kubeconfig_entries(kubeconfig_path: str,
+                              eks_cluster: dict,
+                              cluster_name: str,
+                              cluster_region: str,
+                              cluster_profile: str,
+                              local_api_server_port: int,
+                              default_namespace: str,
+                              set_current_context: bool) -> None:
     if os.path.isfile(kubeconfig_path):
         with open(kubeconfig_path, 'r') as file:
-            kubeconfig = yaml.safe_load(file) or {}
+            kubeconfig = yaml.load(file, Loader=YamlLoader) or {}
     else:
         os.makedirs(os.path.dirname(kubeconfig_path), exist_ok=True)
         with open(kubeconfig_path, 'w+'):
@@ -35,13 +81,17 @@ def update_kubeconfig(boto3_session: boto3.Session,
                 os.chown(kubeconfig_path, uid, gid)
             kubeconfig = {}
 
+    # index the existing entries by name, kubeconfig names are unique
+    clusters_by_name = {cluster.get('name'): cluster for cluster in kubeconfig.get('clusters', [])}
+    contexts_by_name = {context.get('name'): context for context in kubeconfig.get('contexts', [])}
+    users_by_name = {user.get('name'): user for user in kubeconfig.get('users', [])}
+
     # clusters
-    kubeconfig_clusters = kubeconfig.get('clusters', [])
-    existing_cluster_without_target = [cluster for cluster in kubeconfig_clusters if
-                                       not cluster.get('cluster', {}).get('server', '').startswith(eks_cluster['endpoint'])]
+    for name, cluster in list(clusters_by_name.items()):
+        if cluster.get('cluster', {}).get('server', '').startswith(eks_cluster['endpoint']):
+            del clusters_by_name[name]
 
-    account_id = eks_cluster['arn'].split(':')[4]
-    cluster_name_in_kubeconfig = f'{account_id}:{cluster_region}:{cluster_name}'
+    cluster_name_in_kubeconfig = get_kubeconfig_name(eks_cluster['arn'])
     new_cluster = {
         'cluster': {
             'server': f"{eks_cluster['endpoint']}:{local_api_server_port}",
@@ -50,14 +100,15 @@ def update_kubeconfig(boto3_session: boto3.Session,
         'name': cluster_name_in_kubeconfig
     }
 
-    new_clusters = existing_cluster_without_target + [new_cluster]
+    clusters_by_name.pop(cluster_name_in_kubeconfig, None)
+    clusters_by_name[cluster_name_in_kubeconfig] = new_cluster
 
     # contexts
-    kubeconfig_contexts = kubeconfig.get('contexts', [])
-    existing_contexts_without_target = [context for context in kubeconfig_contexts if
-                                        not context.get('context', {}).get('cluster', '').startswith(cluster_name_in_kubeconfig)]
-    existing_context: Optional[dict] = next((context for context in kubeconfig_contexts if
-                                             context.get('context', {}).get('cluster', '').startswith(cluster_name_in_kubeconfig)), None)
+    existing_context: Optional[dict] = None
+    for name, context in list(contexts_by_name.items()):
+        if context.get('context', {}).get('cluster', '').startswith(cluster_name_in_kubeconfig):
+            existing_context = existing_context or context
+            del contexts_by_name[name]
     new_context = {
         'context': {
             'cluster': cluster_name_in_kubeconfig,
@@ -71,11 +122,13 @@ def update_kubeconfig(boto3_session: boto3.Session,
     if namespace := existing_context and existing_context.get('context', {}).get('namespace'):
         new_context['context']['namespace'] = namespace  # type: ignore
 
-    new_contexts = existing_contexts_without_target + [new_context]
+    contexts_by_name.pop(cluster_name_in_kubeconfig, None)
+    contexts_by_name[cluster_name_in_kubeconfig] = new_context
 
     # users
-    kubeconfig_users = kubeconfig.get('users', [])
-    existing_users_without_target = [user for user in kubeconfig_users if not user.get('name').startswith(cluster_name_in_kubeconfig)]
+    for name in list(users_by_name):
+        if name and name.startswith(cluster_name_in_kubeconfig):
+            del users_by_name[name]
     new_user = {
         'name': cluster_name_in_kubeconfig,
         'user': {
@@ -91,20 +144,22 @@ def update_kubeconfig(boto3_session: boto3.Session,
             }
         }
     }
-    new_users = existing_users_without_target + [new_user]
+    users_by_name[cluster_name_in_kubeconfig] = new_user
 
     new_kubeconfig_file = {}
+    # keep the current context when it is set by the caller afterwards
+    current_context: str = cluster_name_in_kubeconfig if set_current_context else kubeconfig.get('current-context') or cluster_name_in_kubeconfig
     kubeconfig_declarations = {
         'apiVersion': 'v1',
         'kind': 'Config',
-        'current-context': cluster_name_in_kubeconfig,
+        'current-context': current_context,
         'preferences': {},
     }
     new_kubeconfig_file.update(kubeconfig_declarations)
-    new_kubeconfig_file['clusters'] = new_clusters
-    new_kubeconfig_file['contexts'] = new_contexts
-    new_kubeconfig_file['users'] = new_users
+    new_kubeconfig_file['clusters'] = list(clusters_by_name.values())
+    new_kubeconfig_file['contexts'] = list(contexts_by_name.values())
+    new_kubeconfig_file['users'] = list(users_by_name.values())
 
-    config_text = yaml.dump(new_kubeconfig_file, default_flow_style=False)
+    config_text = yaml.dump(new_kubeconfig_file, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
     with open(kubeconfig_path, 'w+') as file:
         file.write(config_text)
@@ -1,9 +1,21 @@
+import mmap
+import os
 import platform
 import re
+import threading
+from typing import Any
 
 from beam.exceptions import AdministratorRequiredError
 from beam.utils import logger
 
+# parsed (hostname, host) pairs of the hosts file, invalidated when the file modification time changes
+_HOSTS_CACHE: dict[str, Any] = {'mtime': None, 'entries': set()}
+# serializes the check-and-append, the tunnels are started concurrently
+_hosts_lock = threading.Lock()
+
+# '<hostname> <host> [<host> ...]', ignoring comments
+_HOST_LINE_RE = re.compile(rb'^[ \t]*([^\s#]+)[ \t]+([^#\r\n]*)', re.M)
+
 
 def get_hosts_path() -> str:
     system = platform.system()
@@ -15,21 +27,40 @@ def get_hosts_path() -> str:
         raise OSError(f'Unsupported system: {system}')
 
 
+def _read_hosts_entries(hosts_path: str) -> set[tuple[str, str]]:
+    mtime = os.stat(hosts_path).st_mtime_ns
+    if _HOSTS_CACHE['mtime'] != mtime:
+        entries: set[tuple[str, str]] = set()
+        with open(hosts_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size:  # an empty file can't be mapped
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    for match in _HOST_LINE_RE.finditer(content):
+                        hostname = match.group(1).decode()
+                        entries.update((hostname, host.decode()) for host in match.group(2).split())
+        _HOSTS_CACHE['mtime'] = mtime
+        _HOSTS_CACHE['entries'] = entries
+
+    return _HOSTS_CACHE['entries']
+
+
 def edit_hosts_entry(host: str, hostname: str = '127.0.0.1') -> bool:
     hosts_path = get_hosts_path()
     logger.debug(f'Appending to hosts file ({hosts_path}): {hostname} {host}')
 
     try:
-        # first try to open with read-only to check if editing is required
+        # first check the (cached) read-only content to see if editing is required
         # if yes, open with write permissions
-        with open(hosts_path, 'r') as file:
-            if re.search(rf'({hostname})\s({host})', file.read()):
+        with _hosts_lock:
+            entries = _read_hosts_entries(hosts_path)
+            if (hostname, host) in entries:
                 return True
 
-        logger.debug(f"Host '{host}' not found in hosts file, adding it")
+            logger.debug(f"Host '{host}' not found in hosts file, adding it")
 
-        with open(hosts_path, 'a') as file:
-            file.write(f'{hostname} {host}\n')
+            with open(hosts_path, 'a') as file:
+                file.write(f'{hostname} {host}\n')
+            entries.add((hostname, host))
+            _HOSTS_CACHE['mtime'] = os.stat(hosts_path).st_mtime_ns
         logger.debug(f"Host '{host}' added to hosts file")
     except PermissionError as e:
         logger.exception(f'Permission error while editing the hosts file ({hosts_path})')
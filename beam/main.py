@@ -1,27 +1,24 @@
 #!/usr/bin/python3
+# pylint: disable=import-outside-toplevel
+# the heavy imports (boto3, aws_sso_lib, rich, yaml, ...) are done inside the commands that need them,
+# so `beam --help` and `beam --version` start fast
 import functools
 import logging
 import os
 import sys
 from typing import Any, Callable
 
-import aws_sso_lib
 import click
-import yaml
 from click import Context
-from rich import print  # pylint: disable=redefined-builtin
-from rich.align import Align
-from rich.panel import Panel
-from rich.pretty import Pretty
 
 from beam import settings, __version__
-from beam.aws.utils import AwsOrganization
-from beam.config_loader import BeamConfig
-from beam.runner import BeamRunner
-from beam.selector import ask_for_config
-from beam.utils import logger, get_home_directory, validate_prerequisites
+from beam.utils import logger, get_home_directory, stop_processes, validate_prerequisites, wait_for_processes
 
-DEFAULT_CONFIG_DIRECTORY = os.path.join(get_home_directory(), '.beam', 'config.yaml')
+
+@functools.lru_cache(maxsize=1)
+def get_default_config_path() -> str:
+    # resolved by click only when the --config option is not given, not at import time
+    return os.path.join(get_home_directory(), '.beam', 'config.yaml')
 
 
 def common_params(func: Callable) -> Callable:
@@ -57,12 +54,19 @@ def cli(ctx: Context = None, version: bool = False) -> None:  # pylint: disable=
 
 
 @cli.command()
-@click.option('--config', '-c', default=DEFAULT_CONFIG_DIRECTORY, help='Path to config file to generate')
+@click.option('--config', '-c', default=get_default_config_path, help='Path to config file to generate')
 @click.option('--sso-url', '-c', help='AWS SSO URL')
 @click.option('--sso-region', '-c', help='AWS SSO Region')
 @common_params
 def configure(config: str, sso_url: str, sso_region: str) -> None:
+    import yaml
+    from rich import print  # pylint: disable=redefined-builtin
+
+    from beam._yaml import YamlDumper
+    from beam.selector import ask_for_config
+
     validate_prerequisites_and_exit()
+    setup_yaml()
 
     config = os.path.realpath(config)
     try:
@@ -75,19 +79,29 @@ def configure(config: str, sso_url: str, sso_region: str) -> None:
 
     os.makedirs(os.path.dirname(config), exist_ok=True)
     with open(config, 'w') as file:
-        yaml.dump(beam_config.to_dict(), file)
+        yaml.dump(beam_config.to_dict(), file, Dumper=YamlDumper)
 
     print(f'[bold green]:heavy_check_mark:[/bold green] Config saved to [bold italic bright_cyan]{config}[/bold italic bright_cyan]\n')
 
 
 @cli.command()
-@click.option('--config', '-c', default=DEFAULT_CONFIG_DIRECTORY, help='Path to config file')
+@click.option('--config', '-c', default=get_default_config_path, help='Path to config file')
 @click.option('--force-scan', '-f', default=False, help='Force scan of all accounts', is_flag=True)
 @click.option('--eks/--no-eks', default=True, help='Connect to EKS clusters')
 @click.option('--rds/--no-rds', default=True, help='Connect to RDS clusters')
 @common_params
 def run(config: str, force_scan: bool, eks: bool, rds: bool) -> None:
+    from rich import print  # pylint: disable=redefined-builtin
+    from rich.align import Align
+    from rich.panel import Panel
+    from rich.pretty import Pretty
+
+    from beam.aws.utils import AwsOrganization
+    from beam.config_loader import BeamConfig
+    from beam.runner import BeamRunner
+
     validate_prerequisites_and_exit()
+    setup_yaml()
 
     config = os.path.realpath(config)
     print(Panel(
@@ -99,9 +113,7 @@ def run(config: str, force_scan: bool, eks: bool, rds: bool) -> None:
     # see here https://github.com/pallets/click/issues/66#issuecomment-674322963
 
     try:
-        with open(config, 'r') as file:
-            config_dict = yaml.safe_load(file)
-        beam_config = BeamConfig.from_dict(config_dict)
+        beam_config = BeamConfig.load_config(config)
     except FileNotFoundError:
         logger.error(f'Config file not found: {config}', exc_info=True if settings.debug else None)
         return
@@ -115,7 +127,7 @@ def run(config: str, force_scan: bool, eks: bool, rds: bool) -> None:
     organization = AwsOrganization(beam_config.aws.sso_url, beam_config.aws.sso_region)
     permission_set = beam_config.aws.role  # TODO: ADD TO SELECTOR TO SELECT PS FOR EACH ACCOUNT OR ALL OF THEM
 
-    aws_sso_lib.login(beam_config.aws.sso_url, beam_config.aws.sso_region)
+    organization.login()
 
     beam_runner = BeamRunner(beam_config, config, organization, permission_set)
 
@@ -134,11 +146,10 @@ def run(config: str, force_scan: bool, eks: bool, rds: bool) -> None:
     logger.debug('Finished Beam')
 
     try:
-        [process.wait() for process in processes]
+        wait_for_processes(processes)
     except KeyboardInterrupt:
         logger.debug('Exiting Beam')
-        for process in processes:
-            process.kill()
+        stop_processes(processes)
 
 
 @cli.command()
@@ -153,10 +164,14 @@ def version() -> None:
 
 
 def print_version() -> None:
+    from rich import print  # pylint: disable=redefined-builtin
+
     print(f'[bold yellow3]Beam[/bold yellow3] [white]{__version__}[/white] by [bold magenta]Entitle[/bold magenta] :comet:')
 
 
 def validate_prerequisites_and_exit() -> None:
+    from rich import print  # pylint: disable=redefined-builtin
+
     try:
         validate_prerequisites()
     except Exception as e:
@@ -167,15 +182,22 @@ def validate_prerequisites_and_exit() -> None:
         sys.exit(1)
 
 
+@functools.cache
 def setup_yaml() -> None:
+    import yaml
+
+    from beam._yaml import YamlDumper
+
     def represent_none(self, _) -> Any:  # type: ignore
         return self.represent_scalar('tag:yaml.org,2002:null', '')
 
-    yaml.add_representer(type(None), represent_none)
+    yaml.add_representer(type(None), represent_none, Dumper=yaml.SafeDumper)
+    # the libyaml dumper keeps its own representers, it is the same SafeDumper when libyaml isn't available
+    if YamlDumper is not yaml.SafeDumper:
+        yaml.add_representer(type(None), represent_none, Dumper=YamlDumper)
 
 
 def main() -> None:
-    setup_yaml()
     cli()
 
 
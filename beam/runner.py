@@ -1,17 +1,27 @@
-import concurrent
 import os
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 
 import yaml
 from rich import print  # pylint: disable=redefined-builtin
 
+from beam._yaml import YamlDumper
 from beam.aws.bastion import AwsBastion
-from beam.aws.utils import AwsOrganization
+from beam.aws.models import AwsAccount, AwsEksInstance, AwsRdsInstance
+from beam.aws.utils import AwsOrganization, run_concurrently
 from beam.config_loader import BeamConfig
+from beam.eks import get_kubeconfig_name, set_kubeconfig_current_context
 from beam.utils import logger
 
 
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except OSError:
+        return None
+
+
 class BeamRunner:
     def __init__(self, beam_config: BeamConfig, beam_config_path: str, organization: AwsOrganization, permission_set: str) -> None:
         self.beam_config = beam_config
@@ -21,57 +31,83 @@ class BeamRunner:
 
     def scan_resources(self) -> list[AwsBastion]:
         bastions: list[AwsBastion] = []
+        accounts = [account for account in self.aws_organization.get_accounts() if self._is_account_in_config(account)]
 
-        for account in self.aws_organization.get_accounts():
-            if account.id not in self.beam_config.aws.accounts:
-                logger.debug(f'Skipping account {account} as it is not in config')
-                continue
-            roles = {role[2] for role in self.aws_organization.get_all_roles(account)}
-            if self.beam_config.aws.role not in roles:
-                logger.debug(f'Skipping account {account} as role {self.beam_config.aws.role} is not in {roles}')
-                continue
-            logger.info(f'Found {len(roles)} roles: {roles}')
-            logger.info(f'Processing account {account}')
-
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = [
-                    executor.submit(self.aws_organization.process_account, account, self.permission_set, self.beam_config)
-                ]
-                for future in concurrent.futures.as_completed(futures):
-                    if res := future.result():
-                        logger.info(f'Found {len(res)} bastions: {res}')
-                        bastions.extend(res)
+        if accounts:
+            # the role checks run concurrently, then all the eligible accounts (and their regions) are scanned at once
+            accounts = [account for account, has_role in zip(accounts, run_concurrently(self._has_role, accounts)) if has_role]
+            bastions = self.aws_organization.process_accounts(accounts, self.permission_set, self.beam_config)
 
         logger.info(f'Found {len(bastions)} bastions: {bastions}')
 
+        # the scan completes in any order, a stable order keeps the saved config unchanged between identical scans
+        bastions.sort(key=lambda bastion: (bastion.boto3_session_config.account_id, bastion.boto3_session_config.region, bastion.instance_id))
+
         # save bastions to local config to cache the scan
         self.beam_config.bastions = bastions
         beam_config_dict = self.beam_config.to_dict()
-        os.makedirs(os.path.dirname(self.beam_config_path), exist_ok=True)
-        with open(self.beam_config_path, 'w') as file:
-            yaml.safe_dump(beam_config_dict, file, default_flow_style=False)
+        content = yaml.dump(beam_config_dict, Dumper=YamlDumper, default_flow_style=False).encode('utf-8')
+        if content != _read_file(self.beam_config_path):
+            os.makedirs(os.path.dirname(self.beam_config_path), exist_ok=True)
+            with open(self.beam_config_path, 'wb') as file:
+                file.write(content)
 
         return bastions
 
+    def _is_account_in_config(self, account: AwsAccount) -> bool:
+        if account.id not in self.beam_config.aws.accounts:
+            logger.debug(f'Skipping account {account} as it is not in config')
+            return False
+        return True
+
+    def _has_role(self, account: AwsAccount) -> bool:
+        roles = {role[2] for role in self.aws_organization.get_all_roles(account)}
+        if self.beam_config.aws.role not in roles:
+            logger.debug(f'Skipping account {account} as role {self.beam_config.aws.role} is not in {roles}')
+            return False
+        logger.info(f'Found {len(roles)} roles: {roles}')
+        return True
+
     def connect_to_resources(self, bastions: list[AwsBastion], is_eks_enabled: bool, is_rds_enabled: bool) -> list[subprocess.Popen]:
         processes: list[subprocess.Popen] = []
+        tasks: list[tuple[AwsBastion, Union[AwsEksInstance, AwsRdsInstance]]] = []
 
         for bastion in bastions:
-            try:
-                logger.debug(f'Connecting to Bastion {bastion}')
-
-                if is_eks_enabled:
-                    for eks_instance in bastion.eks_instances:
-                        logger.debug(f'Processing EKS {eks_instance}')
-                        if process := bastion.connect_to_eks(eks_instance, default_namespace=self.beam_config.kubernetes.namespace or 'default'):
-                            processes.append(process)
-
-                if is_rds_enabled:
-                    for rds_instance in bastion.rds_instances:
-                        logger.debug(f'Processing RDS {rds_instance}')
-                        if process := bastion.connect_to_rds(rds_instance):
-                            processes.append(process)
-            except PermissionError as e:
-                print(f'[bold red]ERROR: {e}[/bold red]')
+            logger.debug(f'Connecting to Bastion {bastion}')
+            if is_eks_enabled:
+                tasks.extend((bastion, eks_instance) for eks_instance in bastion.eks_instances)
+            if is_rds_enabled:
+                tasks.extend((bastion, rds_instance) for rds_instance in bastion.rds_instances)
+
+        if not tasks:
+            return processes
+
+        # every tunnel runs in its own (session-manager-plugin) process, so they can all be started concurrently
+        results = run_concurrently(self._connect_to_resource, tasks)
+        processes.extend(process for process in results if process)
+
+        # the clusters are connected in any order, so the kubeconfig current context is set afterwards,
+        # to the last connected cluster in bastions order (as when they were connected one by one)
+        connected_clusters = [instance for (_, instance), process in zip(tasks, results) if process and isinstance(instance, AwsEksInstance)]
+        if connected_clusters:
+            set_kubeconfig_current_context(get_kubeconfig_name(connected_clusters[-1].arn))
 
         return processes
+
+    def _connect_to_resource(self, task: tuple[AwsBastion, Union[AwsEksInstance, AwsRdsInstance]]) -> Optional[subprocess.Popen]:
+        bastion, instance = task
+        try:
+            if isinstance(instance, AwsEksInstance):
+                logger.debug(f'Processing EKS {instance}')
+                return bastion.connect_to_eks(instance, default_namespace=self.beam_config.kubernetes.namespace or 'default',
+                                              set_current_context=False)
+
+            logger.debug(f'Processing RDS {instance}')
+            return bastion.connect_to_rds(instance)
+        except PermissionError as e:
+            print(f'[bold red]ERROR: {e}[/bold red]')
+        except Exception as e:
+            # a failing tunnel must not lose the processes of the tunnels started concurrently
+            logger.exception(f'Failed to connect to {instance} through bastion {bastion}: {e}')
+
+        return None
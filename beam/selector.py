@@ -1,6 +1,6 @@
+import textwrap
 from typing import Optional
 
-import aws_sso_lib
 import questionary
 import validators
 import yaml
@@ -8,7 +8,8 @@ from questionary import Choice
 from rich import print  # pylint: disable=redefined-builtin
 from rich.panel import Panel
 
-from beam.aws.utils import AwsOrganization
+from beam._yaml import YamlDumper
+from beam.aws.utils import AwsOrganization, run_concurrently
 from beam.config_loader import BeamConfig, BeamAwsConfig, BeamBastionConfig, BeamKubernetesConfig, BeamEksConfig, BeamRdsConfig
 
 AWS_REGIONS = [
@@ -67,17 +68,20 @@ def ask_for_config(config_path: str, sso_url: str, sso_region: str) -> Optional[
         sso_url = questionary.text('What is your SSO URL?', validate=_validate_aws_sso_url).unsafe_ask()
         sso_region = questionary.select('What is your SSO region?', choices=AWS_REGIONS).unsafe_ask()
 
-    aws_sso_lib.login(sso_url, sso_region)
-
     organization = AwsOrganization(sso_url, sso_region)
+    organization.login()
     available_aws_accounts = organization.get_accounts()
+    account_choices = [Choice(title=account.name, value=str(account.id)) for account in available_aws_accounts]
 
     aws_accounts = questionary.checkbox('What are your AWS accounts?',
-                                        choices=[Choice(title=account.name, value=str(account.id)) for account in available_aws_accounts],
+                                        choices=account_choices,
                                         validate=lambda x: True if bool(x) else 'Please select at least one account',
                                         ).unsafe_ask()
 
-    all_available_aws_roles = {role[2] for account in available_aws_accounts for role in organization.get_all_roles(account)}
+    # the roles are fetched only once the prompt is closed, so the (debug) logs don't break it
+    roles_per_account = run_concurrently(organization.get_all_roles, available_aws_accounts)
+    all_available_aws_roles = sorted({role[2] for roles in roles_per_account for role in roles})
+
     print(
         'Please choose your preferred Permission Set. '
         '[bold bright_yellow]Notice that this Permission Set will be used to connect to all your accounts.[/bold bright_yellow]')
@@ -119,9 +123,9 @@ def ask_for_config(config_path: str, sso_url: str, sso_region: str) -> Optional[
                              rds=rds,
                              )
 
-    yaml_config = yaml.dump(beam_config.to_dict(), default_flow_style=False)
+    yaml_config = yaml.dump(beam_config.to_dict(), Dumper=YamlDumper, default_flow_style=False)
 
-    yaml_config = '\n'.join(['    ' + line for line in yaml_config.split('\n')])  # add \t before each line
+    yaml_config = textwrap.indent(yaml_config, '    ')
 
     print('\n')
     print('\t[red]Please approve the following config:[/red]\n')
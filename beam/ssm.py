@@ -1,9 +1,8 @@
-import json
 import subprocess
 from typing import Optional
 
-import boto3
-
+from beam._json import dumps as json_dumps
+from beam.aws.models import boto3, get_boto_config
 from beam.utils import logger, execute
 
 
@@ -24,7 +23,6 @@ def start_ssm_forwarding_session(region: str, instance_id: str, host: str, remot
         bool: True if the SSM session and port forwarding were successfully initiated, False otherwise.
 
     Raises:
-        TypeError: If any of the arguments are not of the expected type.
         ValueError: If remote_port or local_port are not within the valid port range (1-65535).
         ValueError: If the instance_id is not a valid AWS EC2 instance identifier.
         ValueError: If the provided host is not a valid hostname or IP address.
@@ -37,26 +35,17 @@ def start_ssm_forwarding_session(region: str, instance_id: str, host: str, remot
     """
     logger.debug(f"Starting SSM session  (instance_id='{instance_id}', remote_port={remote_port}, local_port={local_port})")
 
-    if not isinstance(region, str):
-        raise TypeError('region must be a string')
-    if not isinstance(instance_id, str):
-        raise TypeError('instance_id must be a string')
-    if not isinstance(host, str):
-        raise TypeError('host must be a string')
-    if not isinstance(remote_port, int):
-        raise TypeError('remote_port must be an integer')
-    if not isinstance(local_port, int):
-        raise TypeError('local_port must be an integer')
-    if remote_port < 1 or remote_port > 65535:
-        raise ValueError('remote_port must be between 1 and 65535')
-    if local_port < 1 or local_port > 65535:
-        raise ValueError('local_port must be between 1 and 65535')
+    if __debug__:
+        if remote_port < 1 or remote_port > 65535:
+            raise ValueError('remote_port must be between 1 and 65535')
+        if local_port < 1 or local_port > 65535:
+            raise ValueError('local_port must be between 1 and 65535')
 
     logger.debug(
         f' Starting SSM session to instance_id {instance_id} on port {remote_port} and local port {local_port}')
     try:
         session = boto3.Session(profile_name=profile, region_name=region)
-        ssm_client = session.client('ssm')
+        ssm_client = session.client('ssm', config=get_boto_config())
         ssm_parameters = {
             'host': [host],
             'portNumber': [str(remote_port)],
@@ -101,18 +90,20 @@ def start_aws_ssm_plugin(create_session_response: dict, parameters: dict, profil
 
     command = [
         'session-manager-plugin',
-        f"'{json.dumps(create_session_response)}'",
+        json_dumps(create_session_response),
         region,
         'StartSession',
         profile,
-        f"'{json.dumps(plugin_parameters)}'",
+        json_dumps(plugin_parameters),
         f'https://ssm.{region}.amazonaws.com'
     ]
 
     try:
-        process = execute(' '.join(command))
+        process = execute(command)
         return process
     except subprocess.CalledProcessError as e:
         logger.exception(f'Error executing command: {e.cmd} (return code: {e.returncode}) | Output: {e.output}')
+    except OSError:
+        logger.exception(f'Error executing command: {command[0]}')
 
     return None
@@ -1,11 +1,23 @@
+import concurrent
 import configparser
+import functools
+import hashlib
+import importlib
+import io
+import json
 import logging
 import os
 import platform
+import re
+import shutil
 import subprocess
+import threading
+import time
+import types
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import colorlog
 
@@ -19,27 +31,220 @@ console_handler = colorlog.StreamHandler()
 console_handler.setFormatter(colorlog.ColoredFormatter(DEFAULT_FORMAT, reset=True))
 logger.addHandler(console_handler)
 
+PREREQUISITES_CACHE_TTL = 24 * 60 * 60
+CONNECTIVITY_CHECK_URL = 'https://www.gstatic.com/generate_204'
+CONNECTIVITY_CHECK_TIMEOUT = 3
+# seconds the started processes get to exit after being terminated, before being killed
+PROCESS_STOP_TIMEOUT = 3
+_prerequisites_cache_lock = threading.Lock()
 
-def execute(command: str) -> subprocess.Popen:
-    logger.debug(f'Executing command: {command}')
-    process = subprocess.Popen(command, shell=True)
+# '[section]' headers and 'option = value' lines of an INI file
+_INI_SECTION_HEADER_RE = re.compile(rb'^\[', re.M)
+_INI_OPTION_RE = re.compile(rb'^([^\s=:\[#;][^=:]*?)[ \t]*[=:][ \t]*(.*?)[ \t]*\r?$', re.M)
+
+
+class LazyModule(types.ModuleType):
+    """A module placeholder that imports the real module on first attribute access."""
+
+    def __getattr__(self, name: str) -> Any:
+        module = importlib.import_module(self.__name__)
+        # copy the real module attributes so later lookups don't go through __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def lazy_import(name: str) -> Any:
+    """Defer importing a (heavy) module until it is actually used.
+
+    Args:
+        name (str): The full name of the module to import.
+
+    Returns:
+        LazyModule: A placeholder for the module.
+    """
+    return LazyModule(name)
+
+
+def execute(argv: list[str]) -> subprocess.Popen:
+    logger.debug(f'Executing command: {subprocess.list2cmdline(argv)}')
+    process = subprocess.Popen(argv, shell=False, close_fds=True)
     return process
 
 
+def wait_for_processes(processes: list[subprocess.Popen]) -> None:
+    """Wait until all the given processes exit, in whatever order they exit.
+
+    Args:
+        processes (list[subprocess.Popen]): The processes to wait for.
+    """
+    if not hasattr(os, 'waitpid') or platform.system() == 'Windows':
+        for process in processes:
+            process.wait()
+        return
+
+    remaining: dict[int, subprocess.Popen] = {process.pid: process for process in processes if process.returncode is None}
+    while remaining:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        if (exited_process := remaining.pop(pid, None)) is not None:
+            exited_process.returncode = os.waitstatus_to_exitcode(status)
+            logger.debug(f'Process {pid} exited with return code {exited_process.returncode}')
+
+
+def stop_processes(processes: list[subprocess.Popen], timeout: float = PROCESS_STOP_TIMEOUT) -> None:
+    """Terminate the given processes, and kill the ones that are still alive after the timeout.
+
+    Args:
+        processes (list[subprocess.Popen]): The processes to stop.
+        timeout (float, optional): Seconds to wait for the processes to terminate. Defaults to PROCESS_STOP_TIMEOUT.
+    """
+    alive = [process for process in processes if process.poll() is None]
+    for process in alive:
+        process.terminate()
+
+    deadline = time.monotonic() + timeout
+    for process in alive:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+@functools.lru_cache(maxsize=4096)
 def hash_val(input_string: str, siz: int = 1024) -> int:
-    """Calculate the hash value of a string.
+    """Calculate the (stable) hash value of a string.
 
     Args:
         input_string (str): The string to be hashed.
         siz (int, optional): The size of the hash table. Defaults to 1024.
 
     Returns:
-        int: The hash value of the string.
+        int: The hash value of the string, in the range [0, siz).
     """
-    hash_value = sum(ord(x) for x in input_string)
+    hash_value = int.from_bytes(hashlib.blake2b(input_string.encode('utf-8'), digest_size=8).digest(), 'little')
     return hash_value % siz
 
 
+class AwsConfigWriter:
+    """Batch profile updates to the AWS config file.
+
+    The config file is read once when entering the context and written once
+    (only if a profile was changed) when leaving it. Profiles that already hold
+    the requested values are detected on the raw file content, so the file is
+    only parsed when a profile actually has to be added or updated.
+
+    Args:
+        config_file_path (str, optional): The path to the AWS config file. Defaults to '~/.aws/config'.
+    """
+
+    def __init__(self, config_file_path: Optional[str] = None) -> None:
+        self.config_file_path = config_file_path or os.path.join(str(Path.home()), '.aws', 'config')
+        self._content = b''
+        self._parser: Optional[configparser.RawConfigParser] = None
+        self._changed = False
+
+    def __enter__(self) -> 'AwsConfigWriter':
+        try:
+            with open(self.config_file_path, 'rb') as config_file:
+                self._content = config_file.read()
+        except FileNotFoundError:
+            self._content = b''
+        self._parser = None
+        self._changed = False
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is not None or self._parser is None or not self._changed:
+            return
+
+        buffer = io.StringIO()
+        self._parser.write(buffer)
+        content = buffer.getvalue().encode('utf-8')
+
+        os.makedirs(os.path.dirname(self.config_file_path), exist_ok=True)
+        with open(self.config_file_path, 'wb') as config_file:
+            config_file.write(content)
+        self._content = content
+
+    def _get_parser(self) -> configparser.RawConfigParser:
+        if self._parser is None:
+            # the values are never interpolated, the raw parser skips that work
+            self._parser = configparser.RawConfigParser()
+            self._parser.read_string(self._content.decode('utf-8'), self.config_file_path)
+        return self._parser
+
+    def _get_raw_section(self, section_name: str) -> Optional[dict[str, str]]:
+        header = re.compile(rb'^\[%s\][ \t]*\r?$' % re.escape(section_name.encode('utf-8')), re.M).search(self._content)
+        if header is None:
+            return None
+
+        next_header = _INI_SECTION_HEADER_RE.search(self._content, header.end())
+        body = self._content[header.end():next_header.start() if next_header else len(self._content)]
+        return {match.group(1).decode('utf-8'): match.group(2).decode('utf-8') for match in _INI_OPTION_RE.finditer(body)}
+
+    def add_profile(self, account_id: str, role: str, sso_url: str, default_region: str, sso_region: str,
+                    dont_override: bool = False) -> str:
+        """
+        Add a profile to the AWS config.
+
+        Args:
+            account_id (str): The AWS account ID.
+            role (str): The role name.
+            sso_url (str): The SSO start URL.
+            default_region (str): The default region.
+            sso_region (str): The SSO region.
+            dont_override (bool, optional): Whether to override an existing profile. Defaults to False.
+
+        Returns:
+            str: The profile name.
+        """
+        logger.debug(f'Adding profile to AWS config file: {account_id}-{role}')
+        if not isinstance(account_id, str):
+            raise TypeError("'account_id' must be a string.")
+        if not isinstance(role, str):
+            raise TypeError("'role' must be a string.")
+        if not isinstance(sso_url, str):
+            raise TypeError("'sso_url' must be a string.")
+        if not isinstance(default_region, str):
+            raise TypeError("'default_region' must be a string.")
+        if not isinstance(sso_region, str):
+            raise TypeError("'sso_region' must be a string.")
+
+        profile_name = f'{account_id}-{role}'
+        section_name = f'profile {profile_name}'
+        options = {
+            'sso_start_url': sso_url,
+            'sso_region': sso_region,
+            'sso_account_id': account_id,
+            'sso_role_name': role,
+            'region': default_region,
+            'output': 'json',
+        }
+
+        # fast path, the profile is already in the (unparsed) file with the same values
+        if self._parser is None and (raw_section := self._get_raw_section(section_name)) is not None:
+            if dont_override or options.items() <= raw_section.items():
+                return profile_name
+
+        parser = self._get_parser()
+        if parser.has_section(section_name):
+            if dont_override:
+                return profile_name
+        else:
+            parser.add_section(section_name)
+            self._changed = True
+
+        for option, value in options.items():
+            if not parser.has_option(section_name, option) or parser.get(section_name, option) != value:
+                parser.set(section_name, option, value)
+                self._changed = True
+
+        return profile_name
+
+
 def add_profile_to_aws_config(account_id: str, role: str, sso_url: str, default_region: str, sso_region: str,
                               dont_override: bool = False,
                               config_file_path: Optional[str] = None) -> str:
@@ -58,47 +263,11 @@ def add_profile_to_aws_config(account_id: str, role: str, sso_url: str, default_
     Returns:
         str: The profile name.
     """
-    config_file_path = config_file_path or os.path.join(str(Path.home()), '.aws', 'config')
-    logger.debug(f'Adding profile to AWS config file: {account_id}-{role}')
-    if not isinstance(account_id, str):
-        raise TypeError("'account_id' must be a string.")
-    if not isinstance(role, str):
-        raise TypeError("'role' must be a string.")
-    if not isinstance(sso_url, str):
-        raise TypeError("'sso_url' must be a string.")
-    if not isinstance(default_region, str):
-        raise TypeError("'default_region' must be a string.")
-    if not isinstance(sso_region, str):
-        raise TypeError("'sso_region' must be a string.")
-
-    if not os.path.exists(config_file_path):
-        os.makedirs(os.path.dirname(config_file_path), exist_ok=True)
-
-    parser = configparser.ConfigParser()
-    parser.read(config_file_path)
-
-    profile_name = f'{account_id}-{role}'
-    section_name = f'profile {profile_name}'
-
-    if section_name in parser.sections():
-        if dont_override:
-            return profile_name
-    else:
-        parser.add_section(section_name)
-
-    parser.set(section_name, 'sso_start_url', sso_url)
-    parser.set(section_name, 'sso_region', sso_region)
-    parser.set(section_name, 'sso_account_id', account_id)
-    parser.set(section_name, 'sso_role_name', role)
-    parser.set(section_name, 'region', default_region)
-    parser.set(section_name, 'output', 'json')
-
-    with open(config_file_path, 'w') as config_file:
-        parser.write(config_file)
-
-    return profile_name
+    with AwsConfigWriter(config_file_path) as writer:
+        return writer.add_profile(account_id, role, sso_url, default_region, sso_region, dont_override)
 
 
+@functools.lru_cache(maxsize=1)
 def get_home_directory() -> str:
     """Get the home directory.
 
@@ -111,6 +280,7 @@ def get_home_directory() -> str:
     return str(Path.home())
 
 
+@functools.lru_cache(maxsize=1)
 def get_username() -> str:
     system = platform.system()
     if system == 'Linux':
@@ -120,14 +290,67 @@ def get_username() -> str:
     return os.getlogin()
 
 
+def _get_prerequisites_cache_path() -> str:
+    return os.path.join(get_home_directory(), '.beam', 'cache', 'prereqs.json')
+
+
+def _read_prerequisites_cache() -> dict:
+    try:
+        with open(_get_prerequisites_cache_path()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_prerequisite_cached(name: str, binary_path: str) -> bool:
+    """Check whether a prerequisite probe already succeeded for the currently installed binary.
+
+    Args:
+        name (str): The name of the prerequisite.
+        binary_path (str): The path of the prerequisite binary.
+
+    Returns:
+        bool: True if the probe doesn't need to run again.
+    """
+    with _prerequisites_cache_lock:
+        entry = _read_prerequisites_cache().get(name)
+    try:
+        return (entry is not None
+                and time.time() - entry['ts'] < PREREQUISITES_CACHE_TTL
+                and entry['path'] == binary_path
+                and entry['mtime'] == os.stat(binary_path).st_mtime)
+    except (OSError, KeyError, TypeError):
+        return False
+
+
+def _cache_prerequisite(name: str, binary_path: str) -> None:
+    cache_path = _get_prerequisites_cache_path()
+    try:
+        with _prerequisites_cache_lock:
+            cache = _read_prerequisites_cache()
+            cache[name] = {'ts': time.time(), 'path': binary_path, 'mtime': os.stat(binary_path).st_mtime}
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w') as file:
+                json.dump(cache, file)
+    except OSError as e:
+        logger.debug(f'Failed to write prerequisites cache: {e}')
+
+
 def validate_aws_installation() -> None:
     # pylint: disable=raise-missing-from
     logger.debug('Validating AWS CLI installation')
+    install_message = ('Please install aws-cli: '
+                       'https://docs.aws.amazon.com/cli/latest/userguide/getting-started-install.html')
+    aws_path = shutil.which('aws')
+    if aws_path is None:
+        raise Exception(install_message)
+    if _is_prerequisite_cached('aws', aws_path):
+        return
+
     try:
-        aws_version = subprocess.check_output('aws --version', shell=True).decode('ascii').strip()
-    except subprocess.CalledProcessError:
-        raise Exception(
-            'Please install aws-cli: https://docs.aws.amazon.com/cli/latest/userguide/getting-started-install.html')
+        aws_version = subprocess.check_output([aws_path, '--version']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        raise Exception(install_message)
 
     if not aws_version.startswith('aws-cli/2.'):
         raise Exception('Please update aws-cli to version 2 or higher: '
@@ -136,29 +359,48 @@ def validate_aws_installation() -> None:
         raise Exception('AWS cli version under 2.8 please update to the latest version: '
                         'https://docs.aws.amazon.com/cli/latest/userguide/getting-started-install.html')
 
+    _cache_prerequisite('aws', aws_path)
+
 
 def validate_ssm_installation() -> None:
     # pylint: disable=raise-missing-from
     logger.debug('Validating SSM installation')
+    install_message = ('Please install the Session Manager plugin for the AWS CLI: '
+                       'https://docs.aws.amazon.com/systems-manager/latest/userguide/session-manager-working-with-install-plugin.html')
+    ssm_plugin_path = shutil.which('session-manager-plugin')
+    if ssm_plugin_path is None:
+        raise Exception(install_message)
+    if _is_prerequisite_cached('session-manager-plugin', ssm_plugin_path):
+        return
+
     try:
-        ssm_plugin_output = subprocess.check_output('session-manager-plugin', shell=True).decode('ascii').strip()
+        ssm_plugin_output = subprocess.check_output([ssm_plugin_path]).decode('ascii').strip()
         if not ssm_plugin_output.startswith('The Session Manager plugin was installed successfully'):
             raise Exception('Session Manager plugin not installed')
-    except subprocess.CalledProcessError:
-        raise Exception('Please install the Session Manager plugin for the AWS CLI: '
-                        'https://docs.aws.amazon.com/systems-manager/latest/userguide/session-manager-working-with-install-plugin.html')
+    except (OSError, subprocess.CalledProcessError):
+        raise Exception(install_message)
+
+    _cache_prerequisite('session-manager-plugin', ssm_plugin_path)
 
 
 def validate_internet_connection() -> bool:
     logger.debug('Validating internet connection')
     try:
-        urllib.request.urlopen('https://www.google.com')
-        return True
+        request = urllib.request.Request(CONNECTIVITY_CHECK_URL, method='HEAD')
+        with urllib.request.urlopen(request, timeout=CONNECTIVITY_CHECK_TIMEOUT) as response:
+            status = response.status
     except Exception as e:
         raise Exception('No internet connection') from e
 
+    # a captive portal or a transparent proxy answers with something other than 204
+    if status != 204:
+        raise Exception(f'No internet connection (unexpected connectivity check response: {status})')
+    return True
+
 
 def validate_prerequisites() -> None:
-    validate_internet_connection()
-    validate_aws_installation()
-    validate_ssm_installation()
+    validations = (validate_internet_connection, validate_aws_installation, validate_ssm_installation)
+    with ThreadPoolExecutor(max_workers=len(validations)) as executor:
+        futures = [executor.submit(validation) for validation in validations]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
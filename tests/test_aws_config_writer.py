@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+
+from beam.utils import AwsConfigWriter, add_profile_to_aws_config
+
+PROFILE_ARGS = ('123456789012', 'admin', 'https://example.awsapps.com/start', 'us-east-1', 'us-west-2')
+
+EXISTING_CONFIG = """# managed by hand
+[default]
+region = eu-west-1
+
+[profile 123456789012-admin]
+sso_start_url = https://example.awsapps.com/start
+sso_region = us-west-2
+sso_account_id = 123456789012
+sso_role_name = admin
+region = us-east-1
+output = json
+"""
+
+
+class TestAwsConfigWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, '.aws', 'config')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _write_config(self, content: str) -> None:
+        os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
+        with open(self.config_path, 'w') as file:
+            file.write(content)
+
+    def _read_config(self) -> str:
+        with open(self.config_path, 'r') as file:
+            return file.read()
+
+    def test_adds_profile_to_missing_config(self):
+        profile_name = add_profile_to_aws_config(*PROFILE_ARGS, config_file_path=self.config_path)
+
+        self.assertEqual(profile_name, '123456789012-admin')
+        content = self._read_config()
+        self.assertIn('[profile 123456789012-admin]', content)
+        self.assertIn('sso_account_id = 123456789012', content)
+        self.assertIn('sso_region = us-west-2', content)
+        self.assertIn('region = us-east-1', content)
+
+    def test_skips_write_when_profile_is_unchanged(self):
+        self._write_config(EXISTING_CONFIG)
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+
+        # the file wasn't rewritten, so the comment is still there
+        self.assertEqual(self._read_config(), EXISTING_CONFIG)
+
+    def test_skips_write_when_profile_is_unchanged_with_crlf(self):
+        self._write_config(EXISTING_CONFIG.replace('\n', '\r\n'))
+        with open(self.config_path, 'rb') as file:
+            original = file.read()
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+
+        with open(self.config_path, 'rb') as file:
+            self.assertEqual(file.read(), original)
+
+    def test_updates_changed_profile(self):
+        self._write_config(EXISTING_CONFIG.replace('region = us-east-1', 'region = eu-central-1'))
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+
+        content = self._read_config()
+        self.assertIn('region = us-east-1', content)
+        self.assertNotIn('eu-central-1', content)
+        self.assertIn('[default]', content)
+
+    def test_dont_override_keeps_existing_profile(self):
+        changed_config = EXISTING_CONFIG.replace('region = us-east-1', 'region = eu-central-1')
+        self._write_config(changed_config)
+
+        with AwsConfigWriter(self.config_path) as writer:
+            profile_name = writer.add_profile(*PROFILE_ARGS, dont_override=True)
+
+        self.assertEqual(profile_name, '123456789012-admin')
+        self.assertEqual(self._read_config(), changed_config)
+
+    def test_dont_override_keeps_existing_profile_after_parse(self):
+        changed_config = EXISTING_CONFIG.replace('region = us-east-1', 'region = eu-central-1')
+        self._write_config(changed_config)
+
+        with AwsConfigWriter(self.config_path) as writer:
+            # adding another profile parses the file first, so the existing profile is found by the parser
+            writer.add_profile('210987654321', 'admin', *PROFILE_ARGS[2:])
+            writer.add_profile(*PROFILE_ARGS, dont_override=True)
+
+        content = self._read_config()
+        self.assertIn('[profile 210987654321-admin]', content)
+        self.assertIn('region = eu-central-1', content)
+
+    def test_dont_override_adds_missing_profile(self):
+        self._write_config('[default]\nregion = eu-west-1\n')
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS, dont_override=True)
+
+        self.assertIn('[profile 123456789012-admin]', self._read_config())
+
+    def test_partially_matching_profile_is_completed(self):
+        self._write_config(EXISTING_CONFIG.replace('output = json\n', ''))
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+
+        self.assertIn('output = json', self._read_config())
+
+    def test_similar_profile_name_is_not_matched(self):
+        self._write_config(EXISTING_CONFIG.replace('[profile 123456789012-admin]', '[profile 123456789012-admin-2]'))
+
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+
+        content = self._read_config()
+        self.assertIn('[profile 123456789012-admin]', content)
+        self.assertIn('[profile 123456789012-admin-2]', content)
+
+    def test_batches_profiles_in_a_single_write(self):
+        with AwsConfigWriter(self.config_path) as writer:
+            writer.add_profile(*PROFILE_ARGS)
+            writer.add_profile('210987654321', 'admin', *PROFILE_ARGS[2:])
+            # nothing is written before leaving the context
+            self.assertFalse(os.path.exists(self.config_path))
+
+        content = self._read_config()
+        self.assertIn('[profile 123456789012-admin]', content)
+        self.assertIn('[profile 210987654321-admin]', content)
+
+    def test_does_not_write_on_error(self):
+        self._write_config(EXISTING_CONFIG)
+
+        with self.assertRaises(RuntimeError):
+            with AwsConfigWriter(self.config_path) as writer:
+                writer.add_profile('210987654321', 'admin', *PROFILE_ARGS[2:])
+                raise RuntimeError()
+
+        self.assertEqual(self._read_config(), EXISTING_CONFIG)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from beam._yaml import YamlDumper
+from beam.aws.models import AwsEksInstance, AwsRdsInstance
+from beam.config_loader import BeamConfig
+
+FULL_CONFIG = """
+aws:
+  sso_url: https://example.awsapps.com/start
+  sso_region: us-east-1
+  role: admin
+  accounts:
+  - '123456789012'
+  regions:
+  - us-east-1
+  - eu-west-1
+bastion:
+  tags:
+    Name: '*bastion*'
+    team: platform
+kubernetes:
+  namespace: backend
+eks:
+  enabled: true
+  tags:
+    Name: prod-*
+rds:
+  enabled: false
+  tags:
+bastions:
+- boto3_session_config:
+    account_id: '123456789012'
+    sso_start_url: https://example.awsapps.com/start
+    sso_region: us-east-1
+    role_name: admin
+    region: us-east-1
+    vpc_id: vpc-1
+  instance_id: i-0123456789abcdef0
+  name: prod-bastion
+  vpc_id: vpc-1
+  eks_instances:
+  - name: prod-cluster
+    endpoint: https://ABCDEF.gr7.us-east-1.eks.amazonaws.com
+    arn: arn:aws:eks:us-east-1:123456789012:cluster/prod-cluster
+    vpc_id: vpc-1
+  rds_instances:
+  - identifier: prod-db
+    endpoint: prod-db.abc.us-east-1.rds.amazonaws.com
+    port: 5432
+- boto3_session_config:
+    account_id: '123456789012'
+    sso_start_url: https://example.awsapps.com/start
+    sso_region: us-east-1
+    role_name: admin
+    region: eu-west-1
+  instance_id: i-0fedcba9876543210
+  name: eu-bastion
+  vpc_id: vpc-2
+"""
+
+MINIMAL_CONFIG = """
+aws:
+  sso_url: https://example.awsapps.com/start
+  sso_region: us-east-1
+  role: admin
+  accounts:
+bastion:
+  tags:
+"""
+
+
+class TestBeamConfig(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, 'config.yaml')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _load(self, content: str) -> BeamConfig:
+        with open(self.config_path, 'w') as file:
+            file.write(content)
+        return BeamConfig.load_config(self.config_path)
+
+    def test_load_full_config(self):
+        beam_config = self._load(FULL_CONFIG)
+
+        self.assertEqual(beam_config.aws.accounts, ['123456789012'])
+        self.assertEqual(beam_config.aws.regions, ['us-east-1', 'eu-west-1'])
+        self.assertEqual(beam_config.bastion.name, '*bastion*')
+        self.assertEqual(dict(beam_config.bastion.other_tags), {'team': 'platform'})
+        self.assertEqual(beam_config.kubernetes.namespace, 'backend')
+        self.assertEqual(beam_config.eks.tags, {'Name': 'prod-*'})
+        self.assertFalse(beam_config.rds.enabled)
+        self.assertEqual(beam_config.rds.tags, {})
+
+        bastion, eu_bastion = beam_config.bastions
+        self.assertEqual(bastion.boto3_session_config.vpc_id, 'vpc-1')
+        self.assertIsNone(eu_bastion.boto3_session_config.vpc_id)
+        self.assertEqual(eu_bastion.eks_instances, [])
+        self.assertEqual(eu_bastion.rds_instances, [])
+
+        eks_instance, = bastion.eks_instances
+        self.assertIsInstance(eks_instance, AwsEksInstance)
+        self.assertEqual(eks_instance.local_port,
+                         AwsEksInstance(eks_instance.name, eks_instance.endpoint, eks_instance.arn).local_port)
+        rds_instance, = bastion.rds_instances
+        self.assertIsInstance(rds_instance, AwsRdsInstance)
+        self.assertEqual(rds_instance.port, 5432)
+        self.assertIsNone(rds_instance.vpc_id)
+
+    def test_load_minimal_config_uses_defaults(self):
+        beam_config = self._load(MINIMAL_CONFIG)
+
+        self.assertEqual(beam_config.aws.accounts, [])
+        self.assertEqual(beam_config.aws.regions, [])
+        self.assertEqual(beam_config.bastion.tags, {'Name': '*bastion*'})
+        self.assertEqual(beam_config.kubernetes.namespace, 'default')
+        self.assertTrue(beam_config.eks.enabled)
+        self.assertEqual(beam_config.eks.tags, {})
+        self.assertTrue(beam_config.rds.enabled)
+        self.assertEqual(beam_config.bastions, [])
+
+    def test_missing_required_key(self):
+        with self.assertRaises(KeyError):
+            self._load('aws:\n  sso_url: https://example.awsapps.com/start\nbastion: {}\n')
+
+    def test_round_trip(self):
+        for content in (FULL_CONFIG, MINIMAL_CONFIG):
+            with self.subTest(content=content):
+                beam_config = self._load(content)
+
+                config_dict = beam_config.to_dict()
+                self.assertEqual(BeamConfig.from_dict(config_dict), beam_config)
+
+                # the dict is also what gets saved to the yaml file
+                dumped = yaml.dump(config_dict, Dumper=YamlDumper, default_flow_style=False)
+                self.assertEqual(self._load(dumped), beam_config)
+                self.assertEqual(self._load(dumped).to_dict(), config_dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from parameterized import parameterized
+
+from beam import hosts
+
+
+class TestHosts(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.hosts_path = os.path.join(self.directory.name, 'hosts')
+        hosts._HOSTS_CACHE['mtime'] = None
+        hosts._HOSTS_CACHE['entries'] = set()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _write_hosts(self, content: str) -> None:
+        with open(self.hosts_path, 'w', newline='') as file:
+            file.write(content)
+
+    @parameterized.expand([
+        ('simple', '127.0.0.1 localhost\n', {('127.0.0.1', 'localhost')}),
+        ('aliases', '127.0.0.1\tlocalhost localhost.localdomain  local\n',
+         {('127.0.0.1', 'localhost'), ('127.0.0.1', 'localhost.localdomain'), ('127.0.0.1', 'local')}),
+        ('comment_line', '# 127.0.0.1 commented\n127.0.0.1 localhost\n', {('127.0.0.1', 'localhost')}),
+        ('indented_comment', '   # 127.0.0.1 commented\n', set()),
+        ('inline_comment', '127.0.0.1 localhost # 127.0.0.1 commented\n', {('127.0.0.1', 'localhost')}),
+        ('indented_entry', '  ::1 ip6-localhost\n', {('::1', 'ip6-localhost')}),
+        ('crlf', '127.0.0.1 localhost\r\n10.0.0.1 db.internal\r\n', {('127.0.0.1', 'localhost'), ('10.0.0.1', 'db.internal')}),
+        ('hostname_only', '127.0.0.1\n127.0.0.1 localhost\n', {('127.0.0.1', 'localhost')}),
+        ('no_trailing_newline', '127.0.0.1 localhost', {('127.0.0.1', 'localhost')}),
+        ('empty', '', set()),
+    ])
+    def test_read_hosts_entries(self, _, content, expected_entries):
+        self._write_hosts(content)
+
+        self.assertEqual(hosts._read_hosts_entries(self.hosts_path), expected_entries)
+
+    def test_edit_hosts_entry_appends_missing_host_once(self):
+        self._write_hosts('# comment\n127.0.0.1 localhost\n')
+
+        with mock.patch.object(hosts, 'get_hosts_path', return_value=self.hosts_path):
+            self.assertTrue(hosts.edit_hosts_entry('db.internal'))
+            self.assertTrue(hosts.edit_hosts_entry('db.internal'))
+            self.assertTrue(hosts.edit_hosts_entry('localhost'))
+
+        with open(self.hosts_path, 'r') as file:
+            self.assertEqual(file.read(), '# comment\n127.0.0.1 localhost\n127.0.0.1 db.internal\n')
+
+    def test_edit_hosts_entry_ignores_commented_host(self):
+        self._write_hosts('# 127.0.0.1 db.internal\n')
+
+        with mock.patch.object(hosts, 'get_hosts_path', return_value=self.hosts_path):
+            self.assertTrue(hosts.edit_hosts_entry('db.internal'))
+
+        with open(self.hosts_path, 'r') as file:
+            self.assertEqual(file.read(), '# 127.0.0.1 db.internal\n127.0.0.1 db.internal\n')
+
+
+if __name__ == '__main__':
+    unittest.main()